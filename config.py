@@ -4,6 +4,18 @@
 class Config(object):
     DEBUG = False
     TESTING = False
+    STATUS_POLL_INTERVAL = 5  # Seconds clients should wait between status checks
+    MAX_STATUS_POLL_INTERVAL = 60
+
+    # Admission control for new processes
+    MAX_QUEUE_DEPTH = 20  # Maximum number of processes waiting to start
+    MAX_CLIENT_JOBS = 4  # Maximum number of queued or running processes per client
+    SUBMISSION_BURST = 8  # Maximum number of submissions a client can make at once
+    SUBMISSION_RATE = 1 / 300  # Submissions allowed per second once burst is used
+    LOAD_SHED_LATENCY = 30  # Shed load when input validation takes longer (seconds)
+    LOAD_SHED_WINDOW = 600  # Seconds of recent input validations used for latency
+    LOAD_SHED_RETRY_AFTER = 600
+    JOB_RETENTION = 24 * 3600  # Seconds finished jobs are kept for status and output
 
 
 class ProdConfig(Config):
@@ -7,8 +7,9 @@ def create_app(config="config.ProdConfig"):
     app.config.from_object(config)
 
     with app.app_context():
-        from .routes import osprey
+        from .routes import osprey, osprey_v1
 
         app.register_blueprint(osprey)
+        app.register_blueprint(osprey_v1)
 
         return app
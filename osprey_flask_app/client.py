@@ -0,0 +1,336 @@
+"""Clients for the JSON API of the osprey flask app"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import requests
+import xarray as xr
+from functools import partial
+from urllib.parse import urlparse
+
+
+class OspreyError(Exception):
+    """Error returned by the osprey flask app, including a failed RVIC process.
+    Parameters
+        1. code (str): Identifier of the error (e.g. 'job_not_found').
+        2. message (str): Description of the error.
+        3. status (int): HTTP status code of the response, if any.
+        4. retry_after (str): 'Retry-After' header of the response, if any.
+    """
+
+    def __init__(self, code, message, status=None, retry_after=None):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+def get_poll_interval(attempt, retry_after, min_interval, max_interval):
+    """Get number of seconds to wait before the next status check. The interval doubles after
+    every check (exponential backoff), but is never shorter than the 'Retry-After' given by the
+    app nor longer than max_interval.
+    Parameters
+        1. attempt (int): Number of status checks already made for this job.
+        2. retry_after (str): 'Retry-After' header of the last status response, or None.
+        3. min_interval (float): Seconds to wait after the first status check.
+        4. max_interval (float): Maximum number of seconds to wait.
+    """
+    interval = min_interval * 2**attempt
+    if retry_after is not None:
+        interval = max(interval, float(retry_after))
+    return min(interval, max_interval)
+
+
+class OspreyClient:
+    """Synchronous client for the osprey flask app.
+    Parameters
+        1. base_url (str): Url of the app (e.g. 'http://127.0.0.1:5000').
+        2. download_dir (str): Directory that outputs are saved to. Default is the current directory.
+        3. min_poll_interval (float): Seconds to wait after the first status check. Default is 1.
+        4. max_poll_interval (float): Maximum seconds to wait between status checks. Default is 60.
+        5. timeout (float): Seconds to wait for a submitted job to finish before giving up.
+        Default is 3600.
+        6. submit_timeout (float): Seconds to keep retrying a submission while the app is busy.
+        Default is None (retry until the app accepts it).
+        7. chunk_size (int): Number of bytes written to disk at a time when downloading outputs.
+        Default is 1 MiB.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        download_dir=".",
+        min_poll_interval=1,
+        max_poll_interval=60,
+        timeout=3600,
+        submit_timeout=None,
+        chunk_size=2**20,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.download_dir = download_dir
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.submit_timeout = submit_timeout
+        self.chunk_size = chunk_size
+        self.local = threading.local()  # requests sessions are not thread-safe
+
+    @property
+    def session(self):
+        """requests session of the current thread."""
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def _get(self, route, **kwargs):
+        """Send GET request to JSON API and raise OspreyError if it returns an error."""
+        response = self.session.get(f"{self.base_url}/osprey/v1{route}", **kwargs)
+        if response.status_code >= 400:
+            status = response.status_code
+            retry_after = response.headers.get("Retry-After")
+            try:
+                error = response.json()["error"]
+            except (ValueError, KeyError, TypeError):  # Not an error from the app
+                raise OspreyError(
+                    "http_error",
+                    f"{status} {response.reason}: {response.text}",
+                    status,
+                    retry_after,
+                )
+            raise OspreyError(error["code"], error["message"], status, retry_after)
+        return response
+
+    def models(self):
+        """Get list of available climate models for input forcings."""
+        return self._get("/models").json()["models"]
+
+    def try_submit(self, params, attempt, start):
+        """Try to start full_rvic process once. Return (job id, None) if it was started, or
+        (None, seconds to wait before trying again) if the app is busy (429 or 503). Waits
+        back off exponentially, but are never shorter than the app's 'Retry-After'.
+        Parameters
+            1. params (dict): Inputs of '/osprey/input'.
+            2. attempt (int): Number of submissions already tried for this process.
+            3. start (float): Time at which the first submission was tried.
+        """
+        try:
+            return (self._get("/input", params=params).json()["job_id"], None)
+        except OspreyError as e:
+            if e.status not in (429, 503):
+                raise
+            interval = get_poll_interval(
+                attempt, None, self.min_poll_interval, self.max_poll_interval
+            )
+            if e.retry_after is not None:
+                interval = max(interval, float(e.retry_after))
+            timeout = self.submit_timeout
+            if timeout is not None and time.time() + interval - start > timeout:
+                raise
+            return (None, interval)
+
+    def get_params(self, kwargs):
+        """Convert inputs of submit to url parameters of '/osprey/input'."""
+        return {
+            arg: json.dumps(value) if isinstance(value, dict) else value
+            for arg, value in kwargs.items()
+        }
+
+    def submit(self, **kwargs):
+        """Start full_rvic process and return the id of its job. Takes the same inputs as
+        '/osprey/input' (e.g. run_startdate, stop_date, lons, lats). params_config_dict and
+        convolve_config_dict can be given as dictionaries. If the app is busy, submission is
+        retried until submit_timeout.
+        """
+        params = self.get_params(kwargs)
+        start = time.time()
+        attempt = 0
+        while True:
+            (job_id, interval) = self.try_submit(params, attempt, start)
+            if job_id is not None:
+                return job_id
+            time.sleep(interval)
+            attempt += 1
+
+    def status(self, job_id):
+        """Get status of job (state, queue position, timings, percent complete, output url)."""
+        return self._get(f"/status/{job_id}").json()
+
+    def check(self, job_id, attempt, start):
+        """Check status of job once. Return (status, None) if the job is completed, or
+        (None, seconds to wait before checking again) if it is queued or running.
+        Parameters
+            1. job_id (str): Id of job.
+            2. attempt (int): Number of status checks already made for this job.
+            3. start (float): Time at which waiting for the job started.
+        """
+        response = self._get(f"/status/{job_id}")
+        status = response.json()
+        if status["state"] == "completed":
+            return (status, None)
+        elif status["state"] == "failed":
+            raise OspreyError(status["error"]["code"], status["error"]["message"])
+
+        interval = get_poll_interval(
+            attempt,
+            response.headers.get("Retry-After"),
+            self.min_poll_interval,
+            self.max_poll_interval,
+        )
+        if time.time() + interval - start > self.timeout:
+            raise TimeoutError(
+                f"Process {job_id} did not finish within {self.timeout} seconds."
+            )
+        return (None, interval)
+
+    def wait(self, job_id):
+        """Wait for job to finish, backing off exponentially between status checks.
+        Return status of the completed job.
+        """
+        start = time.time()
+        attempt = 0
+        while True:
+            (status, interval) = self.check(job_id, attempt, start)
+            if status is not None:
+                return status
+            time.sleep(interval)
+            attempt += 1
+
+    def download(self, job_id, output_url):
+        """Stream output netCDF file to download_dir in chunks and return its path."""
+        filename = os.path.basename(urlparse(output_url).path)
+        path = os.path.join(self.download_dir, f"{job_id}-{filename}")
+        partial_path = f"{path}.part"  # Do not leave truncated files on failure
+        try:
+            with self.session.get(output_url, stream=True) as response:
+                response.raise_for_status()
+                with open(partial_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        os.replace(partial_path, path)
+        return path
+
+    def open(self, path):
+        """Open downloaded output as an xarray Dataset. Data is loaded lazily when accessed."""
+        return xr.open_dataset(path)
+
+    def run(self, **kwargs):
+        """Run full_rvic process and return its output as a lazily loaded xarray Dataset.
+        Takes the same inputs as submit.
+        """
+        job_id = self.submit(**kwargs)
+        status = self.wait(job_id)
+        return self.open(self.download(job_id, status["output_url"]))
+
+    def run_many(self, runs):
+        """Run several full_rvic processes and return their outputs in the same order. Jobs are
+        submitted before waiting on any of them so that they are queued together. A run that
+        fails does not stop the others: its place in the returned list holds the exception
+        (e.g. OspreyError or TimeoutError) instead of a Dataset.
+        Parameters
+            1. runs (list): Dictionaries of inputs for each process.
+        """
+        job_ids = []
+        for kwargs in runs:
+            try:
+                job_ids.append(self.submit(**kwargs))
+            except Exception as e:
+                job_ids.append(e)
+
+        outputs = []
+        for job_id in job_ids:
+            if isinstance(job_id, Exception):
+                outputs.append(job_id)
+                continue
+            try:
+                status = self.wait(job_id)
+                outputs.append(self.open(self.download(job_id, status["output_url"])))
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+
+
+class AsyncOspreyClient:
+    """asyncio client for the osprey flask app. Requests are sent from the event loop's default
+    executor, so many jobs can be submitted, polled and downloaded concurrently without blocking
+    the event loop (e.g. a Jupyter kernel). Each executor thread uses its own requests session.
+    Takes the same parameters as OspreyClient.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.client = OspreyClient(*args, **kwargs)
+
+    async def _call(self, func, *args, **kwargs):
+        """Run blocking method of the synchronous client in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def models(self):
+        """Get list of available climate models for input forcings."""
+        return await self._call(self.client.models)
+
+    async def submit(self, **kwargs):
+        """Start full_rvic process and return the id of its job. If the app is busy,
+        submission is retried until submit_timeout.
+        """
+        params = self.client.get_params(kwargs)
+        start = time.time()
+        attempt = 0
+        while True:
+            (job_id, interval) = await self._call(
+                self.client.try_submit, params, attempt, start
+            )
+            if job_id is not None:
+                return job_id
+            await asyncio.sleep(interval)
+            attempt += 1
+
+    async def status(self, job_id):
+        """Get status of job."""
+        return await self._call(self.client.status, job_id)
+
+    async def wait(self, job_id):
+        """Wait for job to finish, backing off exponentially between status checks.
+        Return status of the completed job.
+        """
+        start = time.time()
+        attempt = 0
+        while True:
+            (status, interval) = await self._call(
+                self.client.check, job_id, attempt, start
+            )
+            if status is not None:
+                return status
+            await asyncio.sleep(interval)
+            attempt += 1
+
+    async def download(self, job_id, output_url):
+        """Stream output netCDF file to download_dir in chunks and return its path."""
+        return await self._call(self.client.download, job_id, output_url)
+
+    async def open(self, path):
+        """Open downloaded output as a lazily loaded xarray Dataset."""
+        return await self._call(self.client.open, path)
+
+    async def run(self, **kwargs):
+        """Run full_rvic process and return its output as a lazily loaded xarray Dataset."""
+        job_id = await self.submit(**kwargs)
+        status = await self.wait(job_id)
+        return await self.open(await self.download(job_id, status["output_url"]))
+
+    async def run_many(self, runs):
+        """Run several full_rvic processes concurrently and return their outputs in the
+        same order. A run that fails does not stop the others: its place in the returned list
+        holds the exception (e.g. OspreyError or TimeoutError) instead of a Dataset.
+        Parameters
+            1. runs (list): Dictionaries of inputs for each process.
+        """
+        return await asyncio.gather(
+            *(self.run(**kwargs) for kwargs in runs), return_exceptions=True
+        )
@@ -0,0 +1,100 @@
+"""Admission control for RVIC process submissions"""
+
+import threading
+import time
+
+lock = threading.Lock()
+buckets = {}  # Submission tokens of each client and the time they were last refilled
+
+
+def take_token(client, burst, rate, now, take=True):
+    """Take a submission token from the client's token bucket. Buckets hold up to burst
+    tokens and are refilled at rate tokens per second.
+    Return 0 if a token is available, otherwise the number of seconds until one is.
+    Parameters
+        1. client (str): Id of client (e.g. its address).
+        2. burst (int): Maximum number of submissions a client can make at once.
+        3. rate (float): Number of tokens added to each bucket per second.
+        4. now (float): Current time.
+        5. take (bool): Take the token (True) or only check that one is available (False).
+    """
+    with lock:
+        (tokens, updated) = buckets.get(client, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        if take:
+            buckets[client] = (tokens - 1, now)
+        return 0
+
+
+def prune_buckets(burst, rate, now):
+    """Forget buckets that have refilled, since a full bucket is the same as no bucket.
+    Parameters
+        1. burst (int): Maximum number of submissions a client can make at once.
+        2. rate (float): Number of tokens added to each bucket per second.
+        3. now (float): Current time.
+    """
+    with lock:
+        for client, (tokens, updated) in list(buckets.items()):
+            if tokens + (now - updated) * rate >= burst:
+                del buckets[client]
+
+
+def check_admission(
+    client, queue_depth, client_jobs, latency, expected_wait, config, take=True
+):
+    """Check whether client can submit a new RVIC process. A submission token is only taken
+    once every other check has passed, and only if take is True. Routes check with take=False
+    before resolving inputs, so that busy clients are rejected cheaply, then check again with
+    take=True once the inputs are valid, so that invalid inputs do not use up tokens.
+    Load is only shed while processes are queued, so an idle app always admits a process.
+    Return None if the process is admitted, otherwise (status, code, message, retry_after).
+    Parameters
+        1. client (str): Id of client (e.g. its address).
+        2. queue_depth (int): Number of processes waiting to start.
+        3. client_jobs (int): Number of queued or running processes submitted by client.
+        4. latency (float): Recent time in seconds taken to validate inputs on THREDDS, or None.
+        5. expected_wait (float): Seconds until a newly queued process is expected to start.
+        6. config (dict): App configuration containing the limits.
+        7. take (bool): Take a submission token (True) or only check that one is available.
+    """
+    load_shed_latency = config["LOAD_SHED_LATENCY"]
+    if latency is not None and latency > load_shed_latency and queue_depth > 0:
+        return (
+            503,
+            "overloaded",
+            f"THREDDS is taking {int(latency)} seconds to validate inputs and {queue_depth} "
+            "processes are waiting to start. Try again later.",
+            config["LOAD_SHED_RETRY_AFTER"],
+        )
+
+    max_queue_depth = config["MAX_QUEUE_DEPTH"]
+    if queue_depth >= max_queue_depth:
+        return (
+            429,
+            "queue_full",
+            f"There are already {queue_depth} processes waiting to start.",
+            expected_wait,
+        )
+
+    max_client_jobs = config["MAX_CLIENT_JOBS"]
+    if client_jobs >= max_client_jobs:
+        return (
+            429,
+            "too_many_jobs",
+            f"Client already has {client_jobs} processes queued or running.",
+            expected_wait,
+        )
+
+    wait = take_token(
+        client,
+        config["SUBMISSION_BURST"],
+        config["SUBMISSION_RATE"],
+        time.time(),
+        take,
+    )
+    if wait > 0:
+        return (429, "rate_limited", "Too many processes submitted.", wait)
+
+    return None
@@ -1,20 +1,113 @@
 """Defines all routes available to Flask app"""
 
-from flask import Blueprint, request, Response, url_for
+from flask import Blueprint, current_app, jsonify, request, Response, url_for
 from .run_rvic import run_full_rvic
 from .utils import create_full_arg_dict, inputs_are_valid
+from .limits import check_admission, prune_buckets
 
 import os
+import math
 import requests
+import collections
 import concurrent.futures
+import threading
+import time
 import uuid
 import json
 
 osprey = Blueprint("osprey", __name__, url_prefix="/osprey")
-pool = concurrent.futures.ThreadPoolExecutor(
-    max_workers=os.environ.get("MAX_WORKERS", 1)
-)
+osprey_v1 = Blueprint("osprey_v1", __name__, url_prefix="/osprey/v1")
+max_workers = int(os.environ.get("MAX_WORKERS", 1))
+pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
 jobs = {}  # Used to check if process is still executing and to return output
+# Details of each job. They are added before the job is added to jobs and removed before it
+# is evicted from jobs, so readers must allow for either being missing.
+job_timings = {}  # Stage timestamps and durations (in seconds) of each job
+job_clients = {}  # Client that submitted each job, used for admission control
+# (time, seconds) of recent input validations, used to measure how THREDDS is responding
+validation_times = collections.deque(maxlen=100)
+# Held from the final admission check until the job is registered, so that concurrent
+# submissions cannot exceed the limits
+admission_lock = threading.Lock()
+
+
+def run_timed_rvic(arg_dict, timings):
+    """Run full_rvic process, recording when the job leaves the queue and when it finishes.
+    Parameters
+        1. arg_dict (dict): full dictionary of arguments to pass to osprey
+        2. timings (dict): timings of the job, updated in place
+    """
+    timings["started"] = time.time()
+    try:
+        return run_full_rvic(arg_dict)
+    finally:
+        timings["finished"] = time.time()
+
+
+def resolve_inputs(args, timings):
+    """Create full dictionary of arguments for full_rvic process from url inputs and validate
+    it, recording the duration of each stage in timings. Validation checks the input files on
+    THREDDS, so its duration is also recorded in validation_times, even if it fails.
+    Raises the exception of the stage that failed.
+    Parameters
+        1. args (dict): url inputs of the input route
+        2. timings (dict): timings of the job, updated in place
+    """
+    start = time.time()
+    arg_dict = create_full_arg_dict(args)
+    timings["resolution"] = time.time() - start
+
+    start = time.time()
+    try:
+        inputs_are_valid(arg_dict)
+    finally:
+        finished = time.time()
+        validation_times.append((finished, finished - start))
+    timings["validation"] = finished - start
+    return arg_dict
+
+
+def submit_job(arg_dict, timings, client):
+    """Submit full_rvic process to the pool and return the id used to track it.
+    Parameters
+        1. arg_dict (dict): full dictionary of arguments to pass to osprey
+        2. timings (dict): durations of the stages run before submission
+        3. client (str): id of client submitting the process
+    """
+    job_id = str(uuid.uuid4())  # Generate unique id for tracking request
+    timings["submitted"] = time.time()
+    job_timings[job_id] = timings
+    job_clients[job_id] = client
+    job = pool.submit(run_timed_rvic, arg_dict, timings)
+    jobs[job_id] = job  # Published last, once the job's details are in place
+    return job_id
+
+
+def evict_jobs(now):
+    """Forget jobs that finished more than JOB_RETENTION seconds ago, and the submission
+    tokens of clients whose buckets have refilled.
+    """
+    config = current_app.config
+    prune_buckets(config["SUBMISSION_BURST"], config["SUBMISSION_RATE"], now)
+    retention = config["JOB_RETENTION"]
+    for job_id, timings in list(job_timings.items()):
+        if now - timings.get("finished", now) > retention:
+            del job_timings[job_id]
+            job_clients.pop(job_id, None)
+            jobs.pop(job_id, None)
+
+
+def rejection_response(rejection, json_error=True):
+    """Create response for a submission rejected by admission control.
+    Parameters
+        1. rejection (tuple): (status, code, message, retry_after) from check_admission
+        2. json_error (bool): Create JSON error for the v1 API (True) or plain text (False)
+    """
+    (status, code, message, retry_after) = rejection
+    headers = {"Retry-After": str(math.ceil(retry_after))}
+    if json_error:
+        return error_response(status, code, message, headers)
+    return Response(message, status=status, headers=headers)
 
 
 @osprey.route(
@@ -41,17 +134,21 @@ def input_route():
     Example url: http://127.0.0.1:5001/osprey/input?case_id=sample&run_startdate=2012-12-01-00&stop_date=2012-12-31&lons=-116.46875&lats=50.90625&names=BCHSP&params_config_dict={"OPTIONS": {"LOG_LEVEL": "CRITICAL"}}&convolve_config_dict={"OPTIONS": {"CASESTR": "Historical"}}
     Returns output netCDF file after Convolution process.
     """
+    client = request.remote_addr
+    rejection = get_rejection(client, take=False)
+    if rejection is not None:
+        return rejection_response(rejection, json_error=False)
+
     args = request.args
+    timings = {}
     try:
-        arg_dict = create_full_arg_dict(args)
-        inputs_are_valid(arg_dict)
+        arg_dict = resolve_inputs(args, timings)
     except Exception as e:
         return Response(str(e), status=400)
 
-    rvic_job = pool.submit(run_full_rvic, arg_dict)
-
-    job_id = str(uuid.uuid4())  # Generate unique id for tracking request
-    jobs[job_id] = rvic_job
+    (job_id, rejection) = admit_job(arg_dict, timings, client)
+    if rejection is not None:
+        return rejection_response(rejection, json_error=False)
     return Response(
         "RVIC Process started. Check status: "
         + url_for("osprey.status_route", job_id=job_id),
@@ -65,7 +162,7 @@ def models_route():
     models = json.load(open("models.json"))
     models = models["models"]
     model_list = "<br>".join(models)
-    return Response(f"Available climate models:<br><br>{model_list}", status=201)
+    return Response(f"Available climate models:<br><br>{model_list}", status=200)
 
 
 @osprey.route("/status/<job_id>", methods=["GET"])
@@ -74,10 +171,10 @@ def status_route(job_id):
     try:
         job = jobs[job_id]
     except KeyError:
-        return Response("Process with this id does not exist.", status=201)
+        return Response("Process with this id does not exist.", status=404)
 
     if not job.done():
-        return Response("Process is still running.", status=201)
+        return Response("Process is still running.", status=200)
     else:
         return Response(
             "Process completed. Get output: "
@@ -102,8 +199,321 @@ def output_route(job_id):
         outpath = job.result()
         outpath_response = requests.get(outpath)
     except requests.exceptions.ConnectionError as e:
-        return Response("Process has failed. " + e, status=404)
+        return Response(f"Process has failed. {e}", status=404)
 
     return Response(
         "Process successfully completed.", headers={"Location": outpath}, status=302
     )
+
+
+def error_response(status, code, message, headers=None, **fields):
+    """Create machine-readable JSON error response for the v1 API.
+    Parameters
+        1. status (int): HTTP status code.
+        2. code (str): Short, stable identifier of the error (e.g. 'job_not_found').
+        3. message (str): Human-readable description of the error.
+        4. headers (dict): Optional extra response headers.
+        5. fields: Optional extra fields of the error (e.g. stage='validation').
+    """
+    body = {"error": {"code": code, "message": message, **fields}}
+    return jsonify(body), status, headers or {}
+
+
+def get_job_state(job, timings):
+    """Return state of job: 'queued', 'running', 'completed' or 'failed'."""
+    if job.done():
+        return "failed" if job.exception() is not None else "completed"
+    elif "started" in timings:
+        return "running"
+    else:
+        return "queued"
+
+
+def get_queue_position(timings):
+    """Return number of queued jobs that will start before this one (0 is next in line)."""
+    submitted = timings["submitted"]
+    return sum(
+        1
+        for timings in list(job_timings.values())
+        if "started" not in timings and timings["submitted"] < submitted
+    )
+
+
+def get_stage_durations(timings, now):
+    """Return durations in seconds of each stage of a job. Stages that have not started
+    are None, and stages still in progress are measured up to now.
+    Parameters
+        1. timings (dict): timings of the job recorded by input route and run_timed_rvic
+        2. now (float): current time
+    """
+    started = timings.get("started")
+    finished = timings.get("finished", now)
+    queue_wait = (started or now) - timings["submitted"]
+    wps_execution = finished - started if started is not None else None
+    durations = {
+        "resolution": timings.get("resolution"),
+        "validation": timings.get("validation"),
+        "queue_wait": queue_wait,
+        "wps_execution": wps_execution,
+    }
+    return {
+        stage: round(duration, 3) if duration is not None else None
+        for stage, duration in durations.items()
+    }
+
+
+def get_mean_execution_time():
+    """Return mean WPS execution time of completed jobs, or None if no job has completed."""
+    durations = []
+    for job_id, timings in list(job_timings.items()):
+        job = jobs.get(job_id)
+        if job is not None and job.done() and job.exception() is None:
+            durations.append(timings["finished"] - timings["started"])
+    if not durations:
+        return None
+    return sum(durations) / len(durations)
+
+
+def get_percent_complete(state, wps_execution):
+    """Return percent complete of job. osprey runs synchronously through birdy, so while a
+    job is running this is estimated from the mean execution time of completed jobs
+    (capped at 99) and is None if there is no completed job to compare with.
+    Parameters
+        1. state (str): state of job
+        2. wps_execution (float): time in seconds the job has spent executing on osprey
+    """
+    if state == "completed":
+        return 100
+    elif state == "queued":
+        return 0
+    elif state == "running":
+        mean_execution_time = get_mean_execution_time()
+        if mean_execution_time:
+            return min(99, int(100 * wps_execution / mean_execution_time))
+    return None
+
+
+def get_retry_after(state, wps_execution):
+    """Return number of seconds a client should wait before polling this job again."""
+    poll_interval = current_app.config["STATUS_POLL_INTERVAL"]
+    max_poll_interval = current_app.config["MAX_STATUS_POLL_INTERVAL"]
+    mean_execution_time = get_mean_execution_time()
+    if state == "running" and mean_execution_time:
+        remaining = mean_execution_time - wps_execution
+        return int(max(poll_interval, min(max_poll_interval, remaining)))
+    elif state == "queued":
+        return max_poll_interval
+    return poll_interval
+
+
+def get_queue_depth():
+    """Return number of jobs waiting to start."""
+    return sum(1 for timings in list(job_timings.values()) if "started" not in timings)
+
+
+def get_client_jobs(client):
+    """Return number of queued or running jobs submitted by client. Jobs that are still being
+    submitted are counted as queued.
+    """
+    count = 0
+    for job_id, job_client in list(job_clients.items()):
+        job = jobs.get(job_id)
+        if job_client == client and (job is None or not job.done()):
+            count += 1
+    return count
+
+
+def get_running_times(now):
+    """Return time in seconds each running job has spent executing on osprey."""
+    return [
+        now - timings["started"]
+        for timings in list(job_timings.values())
+        if "started" in timings and "finished" not in timings
+    ]
+
+
+def get_backend_latency(now):
+    """Return mean time in seconds taken to validate inputs on THREDDS in the last
+    LOAD_SHED_WINDOW seconds, or None if no inputs were validated recently. Unlike the
+    execution time of RVIC, which depends on the inputs, this reflects how the backend is
+    responding, and it recovers as soon as validations are fast again.
+    """
+    window = current_app.config["LOAD_SHED_WINDOW"]
+    recent = [
+        seconds
+        for (finished, seconds) in validation_times.copy()
+        if now - finished <= window
+    ]
+    if not recent:
+        return None
+    return sum(recent) / len(recent)
+
+
+def get_expected_wait(queue_depth, now):
+    """Return seconds until a newly queued job is expected to start: the time for the pool's
+    workers to run the jobs queued ahead of it, after the running job nearest to finishing.
+    Returns MAX_STATUS_POLL_INTERVAL if no job has completed to estimate execution time from.
+    Parameters
+        1. queue_depth (int): number of jobs waiting to start
+        2. now (float): current time
+    """
+    config = current_app.config
+    mean_execution_time = get_mean_execution_time()
+    if not mean_execution_time:
+        return config["MAX_STATUS_POLL_INTERVAL"]
+
+    running_times = get_running_times(now)
+    remaining = 0
+    if len(running_times) >= max_workers:  # No idle worker
+        remaining = max(0, mean_execution_time - max(running_times))
+    queue_time = queue_depth * mean_execution_time / max_workers
+    return max(config["STATUS_POLL_INTERVAL"], remaining + queue_time)
+
+
+def get_rejection(client, take):
+    """Check whether client can submit a new process.
+    Return None if admitted, otherwise (status, code, message, retry_after).
+    Parameters
+        1. client (str): id of client submitting the process
+        2. take (bool): take a submission token from the client (see check_admission)
+    """
+    now = time.time()
+    queue_depth = get_queue_depth()
+    return check_admission(
+        client,
+        queue_depth,
+        get_client_jobs(client),
+        get_backend_latency(now),
+        get_expected_wait(queue_depth, now),
+        current_app.config,
+        take,
+    )
+
+
+def admit_job(arg_dict, timings, client):
+    """Check admission of a process with valid inputs and submit it if admitted. Both happen
+    under admission_lock so that concurrent submissions all see each other's jobs.
+    Return (job_id, None) if admitted, otherwise (None, rejection).
+    """
+    with admission_lock:
+        evict_jobs(time.time())
+        rejection = get_rejection(client, take=True)
+        if rejection is not None:
+            return (None, rejection)
+        return (submit_job(arg_dict, timings, client), None)
+
+
+@osprey_v1.route(
+    "/input",
+    methods=["POST", "GET"],
+    endpoint="input_route",
+)
+def v1_input_route():
+    """Provide JSON route to start the full_rvic process. Accepts the same inputs as
+    '/osprey/input'.
+
+    Returns 202 with the id of the job and the url of its status, or 400 with an
+    'invalid_input' error giving the stage ('resolution' or 'validation') that failed.
+    Submissions rejected by admission control return 429 ('queue_full', 'too_many_jobs' or
+    'rate_limited') or 503 ('overloaded') with a 'Retry-After' header.
+    """
+    client = request.remote_addr
+    rejection = get_rejection(client, take=False)
+    if rejection is not None:
+        return rejection_response(rejection)
+
+    args = request.args
+    timings = {}
+    try:
+        arg_dict = resolve_inputs(args, timings)
+    except Exception as e:
+        stage = "validation" if "resolution" in timings else "resolution"
+        return error_response(400, "invalid_input", str(e), stage=stage)
+
+    (job_id, rejection) = admit_job(arg_dict, timings, client)
+    if rejection is not None:
+        return rejection_response(rejection)
+
+    status_url = url_for("osprey_v1.status_route", job_id=job_id)
+    body = {
+        "job_id": job_id,
+        "state": get_job_state(jobs[job_id], timings),
+        "status_url": status_url,
+    }
+    return jsonify(body), 202, {"Location": status_url}
+
+
+@osprey_v1.route("/models", methods=["GET"], endpoint="models_route")
+def v1_models_route():
+    """Provide JSON route to give list of available climate models for input forcings."""
+    models = json.load(open("models.json"))
+    return jsonify({"models": models["models"]}), 200
+
+
+@osprey_v1.route("/status/<job_id>", methods=["GET"], endpoint="status_route")
+def v1_status_route(job_id):
+    """Provide JSON route to check status of RVIC process.
+
+    Returns 200 with the state of the job ('queued', 'running', 'completed' or 'failed'),
+    its position in the queue, the durations in seconds of each stage (resolution, validation,
+    queue wait and WPS execution), its percent complete and, once completed, the url of its
+    output. Unfinished jobs include a 'Retry-After' header giving when to poll again.
+    Returns 404 with a 'job_not_found' error if the job does not exist.
+    """
+    job = jobs.get(job_id)
+    timings = job_timings.get(job_id)
+    if job is None or timings is None:
+        return error_response(
+            404, "job_not_found", "Process with this id does not exist."
+        )
+
+    state = get_job_state(job, timings)
+    durations = get_stage_durations(timings, time.time())
+    body = {
+        "job_id": job_id,
+        "state": state,
+        "queue_position": get_queue_position(timings) if state == "queued" else None,
+        "percent_complete": get_percent_complete(state, durations["wps_execution"]),
+        "timings": durations,
+        "output_url": job.result() if state == "completed" else None,
+        "error": None,
+    }
+    headers = {}
+    if state == "failed":
+        body["error"] = {"code": "job_failed", "message": str(job.exception())}
+    elif state != "completed":
+        headers["Retry-After"] = str(get_retry_after(state, durations["wps_execution"]))
+    return jsonify(body), 200, headers
+
+
+@osprey_v1.route("/output/<job_id>", methods=["GET"], endpoint="output_route")
+def v1_output_route(job_id):
+    """Provide JSON route to get streamflow output of RVIC process.
+
+    Returns 303 redirecting to the output netCDF file once the job has completed, 409 with a
+    'job_not_finished' error and a 'Retry-After' header while it is queued or running, 502
+    with a 'job_failed' error if osprey failed, or 404 with a 'job_not_found' error.
+    """
+    job = jobs.get(job_id)
+    timings = job_timings.get(job_id)
+    if job is None or timings is None:
+        return error_response(
+            404, "job_not_found", "Process with this id does not exist."
+        )
+
+    state = get_job_state(job, timings)
+    if state == "failed":
+        return error_response(502, "job_failed", str(job.exception()))
+    elif state != "completed":
+        wps_execution = get_stage_durations(timings, time.time())["wps_execution"]
+        headers = {"Retry-After": str(get_retry_after(state, wps_execution))}
+        return error_response(
+            409, "job_not_finished", f"Process is still {state}.", headers
+        )
+
+    output_url = job.result()
+    return (
+        jsonify({"job_id": job_id, "output_url": output_url}),
+        303,
+        {"Location": output_url},
+    )
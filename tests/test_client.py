@@ -0,0 +1,226 @@
+import pytest
+
+from osprey_flask_app import create_app, limits, routes
+from osprey_flask_app.client import (
+    AsyncOspreyClient,
+    OspreyClient,
+    OspreyError,
+    get_poll_interval,
+)
+from werkzeug.middleware.shared_data import SharedDataMiddleware
+from werkzeug.exceptions import NotFound
+from werkzeug.serving import make_server
+import asyncio
+import os
+import requests
+import threading
+import time
+import xarray as xr
+
+
+def serve(wsgi_app):
+    """Serve wsgi_app in a thread and return (url, server)."""
+    server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever).start()
+    return (f"http://127.0.0.1:{server.server_port}", server)
+
+
+@pytest.fixture
+def output_url(tmp_path):
+    """Url of a small netCDF file standing in for RVIC output."""
+    outputs_dir = tmp_path / "outputs"
+    outputs_dir.mkdir()
+    xr.Dataset({"streamflow": ("time", [1.0, 2.0, 3.0])}).to_netcdf(
+        outputs_dir / "sample.rvic.h0a.nc"
+    )
+    (url, server) = serve(SharedDataMiddleware(NotFound(), {"/": str(outputs_dir)}))
+    yield f"{url}/sample.rvic.h0a.nc"
+    server.shutdown()
+
+
+@pytest.fixture
+def app(monkeypatch, output_url):
+    """App whose RVIC processes are replaced by fast fakes. Processes take 'duration'
+    seconds and fail if 'fail' is given.
+    """
+
+    def run_full_rvic(arg_dict):
+        time.sleep(float(arg_dict.get("duration", 0)))
+        if "fail" in arg_dict:
+            raise ValueError("RVIC failed")
+        return output_url
+
+    monkeypatch.setattr(routes, "create_full_arg_dict", lambda args: dict(args))
+    monkeypatch.setattr(routes, "inputs_are_valid", lambda arg_dict: True)
+    monkeypatch.setattr(routes, "run_full_rvic", run_full_rvic)
+
+    flask_app = create_app("config.TestConfig")
+    flask_app.config.update(
+        STATUS_POLL_INTERVAL=0, MAX_STATUS_POLL_INTERVAL=1, SUBMISSION_BURST=100
+    )
+    yield flask_app
+    limits.buckets.clear()
+
+
+@pytest.fixture
+def base_url(app):
+    (url, server) = serve(app)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def download_dir(tmp_path):
+    download_dir = tmp_path / "downloads"
+    download_dir.mkdir()
+    return download_dir
+
+
+@pytest.mark.parametrize(
+    ("attempt", "retry_after", "expected"),
+    [
+        (0, None, 1),
+        (3, None, 8),
+        (10, None, 60),  # Capped at max interval
+        (0, "5", 5),  # Never shorter than Retry-After
+        (3, "5", 8),
+        (0, "120", 60),
+    ],
+)
+def test_get_poll_interval(attempt, retry_after, expected):
+    assert get_poll_interval(attempt, retry_after, 1, 60) == expected
+
+
+def test_job_not_found(base_url):
+    with pytest.raises(OspreyError) as e:
+        OspreyClient(base_url).status("does-not-exist")
+    assert e.value.code == "job_not_found"
+
+
+def test_non_json_error(base_url):
+    with pytest.raises(OspreyError) as e:
+        OspreyClient(base_url)._get("/does-not-exist")  # Flask's HTML 404 page
+    assert e.value.code == "http_error"
+    assert e.value.message.startswith("404")
+
+
+def test_run(base_url, download_dir):
+    client = OspreyClient(base_url, download_dir=download_dir, min_poll_interval=0.1)
+    output = client.run(duration=0.3)
+    assert list(output["streamflow"].values) == [1.0, 2.0, 3.0]
+    assert [f.endswith("sample.rvic.h0a.nc") for f in os.listdir(download_dir)] == [
+        True
+    ]
+
+
+def test_wait_failed(base_url):
+    client = OspreyClient(base_url, min_poll_interval=0.1)
+    job_id = client.submit(fail=1)
+    with pytest.raises(OspreyError) as e:
+        client.wait(job_id)
+    assert e.value.code == "job_failed"
+
+
+def test_wait_timeout(base_url):
+    client = OspreyClient(base_url, min_poll_interval=0.1, timeout=0.2)
+    job_id = client.submit(duration=1)
+    with pytest.raises(TimeoutError):
+        client.wait(job_id)
+    routes.jobs[job_id].result()  # Do not leave job running for other tests
+
+
+@pytest.mark.parametrize(
+    ("limits_config", "code"),
+    [({"MAX_CLIENT_JOBS": 0}, "too_many_jobs"), ({"MAX_QUEUE_DEPTH": 0}, "queue_full")],
+)
+def test_submit_timeout(limits_config, code, app, base_url):
+    app.config.update(limits_config)
+    client = OspreyClient(base_url, min_poll_interval=0.1, submit_timeout=0.5)
+    start = time.time()
+    with pytest.raises(OspreyError) as e:
+        client.submit()
+    assert e.value.code == code
+    assert e.value.status == 429
+    assert time.time() - start < 0.5
+
+
+def test_submit_retries_when_busy(app, base_url):
+    app.config.update(MAX_CLIENT_JOBS=1)
+    client = OspreyClient(base_url, min_poll_interval=0.1)
+    first_job_id = client.submit(duration=0.5)
+    second_job_id = client.submit()  # Rejected until the first job finishes
+    assert routes.jobs[first_job_id].done()
+    assert client.wait(second_job_id)["state"] == "completed"
+
+
+def test_download_removes_partial_file(monkeypatch, output_url, download_dir):
+    def iter_content(self, chunk_size=1):
+        yield b"CDF"
+        raise requests.exceptions.ConnectionError("Connection lost")
+
+    monkeypatch.setattr(requests.Response, "iter_content", iter_content)
+    client = OspreyClient("http://127.0.0.1", download_dir=download_dir)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.download("job", output_url)
+    assert os.listdir(download_dir) == []
+
+
+def test_async_run_many(app, base_url, download_dir):
+    app.config.update(MAX_CLIENT_JOBS=1)  # Later runs must retry submission
+    client = AsyncOspreyClient(
+        base_url, download_dir=download_dir, min_poll_interval=0.1
+    )
+    runs = [{"duration": 0.2}, {"fail": 1}, {"duration": 0.2}]
+    outputs = asyncio.run(client.run_many(runs))
+    assert "streamflow" in outputs[0].variables
+    assert isinstance(outputs[1], OspreyError)
+    assert outputs[1].code == "job_failed"
+    assert "streamflow" in outputs[2].variables
+
+
+@pytest.mark.online
+def test_invalid_input():
+    flask_app = create_app()
+    (url, server) = serve(flask_app)
+    try:
+        with pytest.raises(OspreyError) as e:
+            OspreyClient(url).submit(
+                run_startdate="2012-12-01-00",
+                stop_date="2012-12-31",
+                lons="0",  # Point not in any modelled watershed
+                lats="0",
+            )
+        assert e.value.code == "invalid_input"
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.online
+def test_run_many(tmp_path):
+    runs = [
+        {
+            "run_startdate": "2012-12-01-00",
+            "stop_date": "2012-12-31",
+            "lons": "-116.46875",
+            "lats": "50.90625",
+            "names": "BCHSP",
+        },
+        {
+            "run_startdate": "2012-12-01-00",
+            "stop_date": "2012-12-31",
+            "lons": "-124.90625",
+            "lats": "57.21875",
+            "names": "ARNT7",
+            "params_config_dict": {"OPTIONS": {"LOG_LEVEL": "CRITICAL"}},
+        },
+    ]
+    flask_app = create_app()
+    (url, server) = serve(flask_app)
+    try:
+        client = AsyncOspreyClient(url, download_dir=tmp_path)
+        outputs = asyncio.run(client.run_many(runs))
+    finally:
+        server.shutdown()
+    assert len(outputs) == len(runs)
+    for output in outputs:
+        assert "streamflow" in output.variables
@@ -0,0 +1,214 @@
+import pytest
+
+from osprey_flask_app import create_app, limits, routes
+from osprey_flask_app.limits import check_admission, prune_buckets, take_token
+from config import Config
+import concurrent.futures
+import time
+
+
+@pytest.fixture(autouse=True)
+def clear_buckets():
+    limits.buckets.clear()
+    yield
+    limits.buckets.clear()
+
+
+@pytest.fixture
+def config():
+    return {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+
+@pytest.fixture
+def app():
+    flask_app = create_app("config.TestConfig")
+    yield flask_app
+
+    routes.job_timings.clear()
+    routes.job_clients.clear()
+    routes.jobs.clear()
+    routes.validation_times.clear()
+
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as testing_client:
+        yield testing_client
+
+
+def test_take_token():
+    for i in range(3):  # Burst
+        assert take_token("client", 3, 0.5, 0) == 0
+    assert take_token("client", 3, 0.5, 0) == 2  # Bucket is empty
+    assert take_token("other", 3, 0.5, 0) == 0  # Buckets are per client
+    assert take_token("client", 3, 0.5, 2) == 0  # Refilled
+    assert take_token("client", 3, 0.5, 100) == 0
+    assert limits.buckets["client"] == (2, 100)  # Never holds more than burst
+
+
+@pytest.mark.parametrize(
+    ("queue_depth", "client_jobs", "latency", "status", "code"),
+    [
+        (0, 0, None, None, None),
+        (1, 0, 10, None, None),
+        (0, 0, 60, None, None),  # Nothing to shed while the queue is empty
+        (1, 0, 60, 503, "overloaded"),
+        (20, 0, None, 429, "queue_full"),
+        (0, 4, None, 429, "too_many_jobs"),
+    ],
+)
+def test_check_admission(queue_depth, client_jobs, latency, status, code, config):
+    rejection = check_admission("client", queue_depth, client_jobs, latency, 30, config)
+    if status is None:
+        assert rejection is None
+    else:
+        assert rejection[:2] == (status, code)
+        assert rejection[3] > 0
+
+
+def test_check_admission_rate_limited(config):
+    for i in range(config["SUBMISSION_BURST"]):
+        assert check_admission("client", 0, 0, None, 30, config) is None
+    (status, code, message, retry_after) = check_admission(
+        "client", 0, 0, None, 30, config
+    )
+    assert (status, code) == (429, "rate_limited")
+    assert 0 < retry_after <= 1 / config["SUBMISSION_RATE"]
+
+
+def test_rejected_submission_keeps_token(config):
+    check_admission("client", 20, 0, None, 30, config)  # Queue is full
+    assert "client" not in limits.buckets
+
+
+def test_take_token_check_only():
+    assert take_token("client", 1, 0.5, 0, take=False) == 0
+    assert take_token("client", 1, 0.5, 0, take=False) == 0
+    assert "client" not in limits.buckets
+
+
+def test_prune_buckets():
+    take_token("full", 3, 0.5, 0)
+    take_token("empty", 3, 0.5, 0)
+    take_token("empty", 3, 0.5, 0)
+    prune_buckets(3, 0.5, 2)
+    assert list(limits.buckets) == ["empty"]
+    prune_buckets(3, 0.5, 4)
+    assert limits.buckets == {}
+
+
+def add_job(job_id, started=None, finished=None):
+    """Add a job submitted at time 0 to the app, with its execution on osprey starting and
+    finishing at the given times.
+    """
+    job = concurrent.futures.Future()
+    timings = {"submitted": 0}
+    if started is not None:
+        timings["started"] = started
+    if finished is not None:
+        timings["finished"] = finished
+        job.set_result("output.nc")
+    routes.job_timings[job_id] = timings
+    routes.jobs[job_id] = job
+
+
+def add_validations(seconds):
+    """Record recent input validations that took seconds."""
+    for i in range(3):
+        routes.validation_times.append((time.time(), seconds))
+
+
+@pytest.fixture
+def fake_rvic(monkeypatch):
+    """Replace inputs and RVIC process by fast fakes."""
+    monkeypatch.setattr(routes, "create_full_arg_dict", lambda args: dict(args))
+    monkeypatch.setattr(routes, "inputs_are_valid", lambda arg_dict: True)
+    monkeypatch.setattr(routes, "run_full_rvic", lambda arg_dict: "output.nc")
+
+
+@pytest.mark.parametrize(
+    ("limits_config", "queued", "validation", "status", "code"),
+    [
+        ({"MAX_QUEUE_DEPTH": 0}, 0, None, 429, "queue_full"),
+        ({"SUBMISSION_BURST": 0}, 0, None, 429, "rate_limited"),
+        ({"LOAD_SHED_LATENCY": 30}, 1, 60, 503, "overloaded"),
+    ],
+)
+@pytest.mark.parametrize(("route"), [("/osprey/input"), ("/osprey/v1/input")])
+def test_input_rejected(
+    route, limits_config, queued, validation, status, code, app, client
+):
+    app.config.update(limits_config)
+    for i in range(queued):
+        add_job(f"queued-{i}")
+    if validation is not None:
+        add_validations(validation)
+
+    response = client.get(route)
+    assert response.status_code == status
+    assert int(response.headers["Retry-After"]) > 0
+    if route.startswith("/osprey/v1"):
+        assert response.json["error"]["code"] == code
+
+
+def test_load_shedding_recovers(app, client):
+    app.config.update(LOAD_SHED_LATENCY=30, LOAD_SHED_WINDOW=600)
+    add_job("queued")
+    routes.validation_times.append((time.time() - 60, 120))
+    assert client.get("/osprey/v1/input").status_code == 503
+
+    routes.validation_times.clear()
+    routes.validation_times.append((time.time() - 700, 120))  # Outside window
+    response = client.get("/osprey/v1/input")  # Inputs are missing
+    assert response.status_code == 400
+
+
+def test_slow_validation_without_queue_admitted(app, client):
+    add_validations(120)
+    response = client.get("/osprey/v1/input")  # Inputs are missing
+    assert response.status_code == 400
+
+
+def test_idle_app_accepts_job_after_long_run(app, client, fake_rvic):
+    now = time.time()
+    add_job("long", started=now - 4000, finished=now - 1)
+    response = client.get("/osprey/v1/input")
+    assert response.status_code == 202
+    routes.jobs[response.json["job_id"]].result()
+
+
+def test_validation_recorded(app, client, fake_rvic):
+    for route in ("/osprey/input", "/osprey/v1/input"):
+        assert client.get(route).status_code == 202
+    assert len(routes.validation_times) == 2
+    for job_id in list(routes.jobs):
+        routes.jobs[job_id].result()
+        assert "validation" in routes.job_timings[job_id]
+
+
+@pytest.mark.parametrize(
+    ("limits_config", "code"),
+    [({"MAX_QUEUE_DEPTH": 3}, "queue_full"), ({"MAX_CLIENT_JOBS": 0}, "too_many_jobs")],
+)
+def test_retry_after_from_queue(limits_config, code, monkeypatch, app, client):
+    monkeypatch.setattr(routes, "max_workers", 2)
+    app.config.update(limits_config)
+    now = time.time()
+    add_job("completed", started=now - 1000, finished=now - 900)  # Mean is 100 seconds
+    add_job("running", started=now - 40)
+    add_job("other running", started=now - 20)
+    for i in range(3):
+        add_job(f"queued-{i}")
+
+    response = client.get("/osprey/v1/input")
+    assert response.json["error"]["code"] == code
+    # 60 seconds until a worker is free, then 3 jobs of 100 seconds over 2 workers
+    assert int(response.headers["Retry-After"]) == 60 + 150
+
+
+@pytest.mark.parametrize(("route"), [("/osprey/input"), ("/osprey/v1/input")])
+def test_invalid_input_keeps_token(route, app, client):
+    app.config.update(SUBMISSION_BURST=1)
+    for i in range(3):
+        assert client.get(route).status_code == 400  # Inputs are missing
+    assert limits.buckets == {}
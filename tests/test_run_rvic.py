@@ -19,7 +19,7 @@ def client():
             yield testing_client
 
 
-def full_rvic_test(kwargs, client, valid_input=True):
+def legacy_full_rvic_test(kwargs, client, valid_input=True):
     input_params = urlencode(kwargs)
     input_url = f"/osprey/input?{input_params}"
     input_response = client.get(input_url)
@@ -38,14 +38,56 @@ def full_rvic_test(kwargs, client, valid_input=True):
             break
         time.sleep(1)
         status_response = client.get(status_url)
+    assert status_response.status_code == 200
     assert b"Process completed." in status_response.data
 
     output_url = status_response.data.split()[-1].decode("utf-8")
     output_response = client.get(output_url)
+    assert output_response.status_code == 302
     streamflow_path = output_response.headers.get("Location")
     assert requests.get(streamflow_path).status_code == 200
 
 
+def v1_full_rvic_test(kwargs, client, valid_input=True):
+    input_params = urlencode(kwargs)
+    input_url = f"/osprey/v1/input?{input_params}"
+    input_response = client.get(input_url)
+    if valid_input:
+        assert input_response.status_code == 202
+    else:
+        assert input_response.status_code == 400
+        assert input_response.json["error"]["code"] == "invalid_input"
+        return
+
+    status_url = input_response.json["status_url"]
+    status_response = client.get(status_url)
+
+    timeout = 1800  # Time to timeout in seconds
+    elapsed = 0
+    while status_response.json["state"] in ("queued", "running") and elapsed < timeout:
+        retry_after = int(status_response.headers.get("Retry-After"))
+        time.sleep(retry_after)
+        elapsed += retry_after
+        status_response = client.get(status_url)
+    assert status_response.status_code == 200
+    assert status_response.json["state"] == "completed"
+    assert status_response.json["percent_complete"] == 100
+
+    output_url = f"/osprey/v1/output/{input_response.json['job_id']}"
+    output_response = client.get(output_url)
+    assert output_response.status_code == 303
+    streamflow_path = output_response.headers.get("Location")
+    assert streamflow_path == status_response.json["output_url"]
+    assert requests.get(streamflow_path).status_code == 200
+
+
+def full_rvic_test(kwargs, client, api, valid_input=True):
+    if api == "legacy":
+        legacy_full_rvic_test(kwargs, client, valid_input)
+    else:
+        v1_full_rvic_test(kwargs, client, valid_input)
+
+
 @pytest.mark.online
 @pytest.mark.parametrize(
     ("kwargs"),
@@ -104,8 +146,9 @@ def full_rvic_test(kwargs, client, valid_input=True):
         ),
     ],
 )
-def test_run_full_rvic_online_valid(kwargs, client):
-    full_rvic_test(kwargs, client, valid_input=True)
+@pytest.mark.parametrize(("api"), [("legacy"), ("v1")])
+def test_run_full_rvic_online_valid(kwargs, api, client):
+    full_rvic_test(kwargs, client, api, valid_input=True)
 
 
 @pytest.mark.online
@@ -144,8 +187,9 @@ def test_run_full_rvic_online_valid(kwargs, client):
         ),
     ],
 )
-def test_run_full_rvic_multiple_points(kwargs, client):
-    full_rvic_test(kwargs, client, valid_input=True)
+@pytest.mark.parametrize(("api"), [("legacy"), ("v1")])
+def test_run_full_rvic_multiple_points(kwargs, api, client):
+    full_rvic_test(kwargs, client, api, valid_input=True)
 
 
 @pytest.mark.online
@@ -225,8 +269,28 @@ def test_run_full_rvic_multiple_points(kwargs, client):
         ),
     ],
 )
-def test_run_full_rvic_online_invalid(kwargs, client):
-    full_rvic_test(kwargs, client, valid_input=False)
+@pytest.mark.parametrize(("api"), [("legacy"), ("v1")])
+def test_run_full_rvic_online_invalid(kwargs, api, client):
+    full_rvic_test(kwargs, client, api, valid_input=False)
+
+
+def test_models(client):
+    models_response = client.get("/osprey/v1/models")
+    assert models_response.status_code == 200
+    assert "ACCESS1-0_rcp45_r1i1p1" in models_response.json["models"]
+
+
+@pytest.mark.parametrize(
+    ("route"),
+    [
+        ("/osprey/v1/status/does-not-exist"),
+        ("/osprey/v1/output/does-not-exist"),
+    ],
+)
+def test_job_not_found(route, client):
+    response = client.get(route)
+    assert response.status_code == 404
+    assert response.json["error"]["code"] == "job_not_found"
 
 
 @pytest.mark.parametrize(